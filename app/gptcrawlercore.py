@@ -1,18 +1,337 @@
 # app/gptcrawlercore.py
 
 import asyncio
-import json
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import contextlib
+import functools
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
 import re
 import os
-from typing import List, Set
+from typing import Deque, Dict, List, Optional, Set, Tuple
 from urllib.parse import urlparse, urljoin, urlunparse
+import aiofiles
+import aiohttp
+import orjson
 from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeoutError
 from bs4 import BeautifulSoup
-from redis import Redis
+import lxml.html
+from lxml import etree
+from redis.asyncio import Redis
 import time
 
+logger = logging.getLogger(__name__)
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/115.0.0.0 Safari/537.36"
+)
+
+# Job progress is pushed to Redis in one pipeline this often, or sooner once enough pages finished
+PROGRESS_FLUSH_INTERVAL = 0.25
+PROGRESS_FLUSH_PAGES = 10
+
+# Pages whose static HTML yields less text than this are assumed to need JavaScript
+MIN_STATIC_TEXT_LENGTH = 200
+# Documents shorter than this cannot hold any text worth parsing
+MIN_HTML_LENGTH = 32
+# MIME types that are parsed for text; anything else is skipped
+HTML_CONTENT_TYPES = frozenset({'text/html', 'application/xhtml+xml'})
+
+# Parser processes started when PARSE_WORKERS is not set, each one costs ~50 MB of memory
+DEFAULT_PARSE_WORKERS = 2
+
+# Elements that never contribute to the page's main text
+UNWANTED_TAGS = frozenset({'script', 'style', 'noscript', 'navbar', 'footer', 'header', 'ads', 'nav'})
+UNWANTED_CLASSES = frozenset({'navbar', 'footer', 'header', 'ads', 'nav'})
+# The same rules as a CSS selector, for scrubbing rendered pages in the browser
+BOILERPLATE_SELECTOR = ",".join(
+    [*sorted(UNWANTED_TAGS), *(f".{name}" for name in sorted(UNWANTED_CLASSES)), "aside.ad", "div.ad"]
+)
+
+# Collects links, drops boilerplate and returns the body text in one page.evaluate round-trip
+EXTRACT_CONTENT_JS = """(selector) => {
+    const links = Array.from(document.querySelectorAll('a[href]'), a => a.href).filter(href => href);
+    document.querySelectorAll(selector).forEach(e => e.remove());
+    const text = document.body ? document.body.innerText : '';
+    return {title: document.title, text: text.replace(/\\s+/g, ' ').trim(), links: links};
+}"""
+
+
+
+def _has_class(name: str) -> str:
+    # XPath predicate matching a whole class token, not a substring of one
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# The same rules as a single XPath, so the lxml tree is swept once
+BOILERPLATE_XPATH = etree.XPath("|".join(
+    [f".//{name}" for name in sorted(UNWANTED_TAGS)]
+    + [f".//*[{' or '.join(_has_class(name) for name in sorted(UNWANTED_CLASSES))}]"]
+    + [f".//aside[{_has_class('ad')}]", f".//div[{_has_class('ad')}]"]
+))
+
+# Static resources filtered inside the browser, so they never reach Playwright
+BLOCKED_URL_PATTERNS = [
+    # Images
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.avif", "*.ico", "*.bmp",
+    # Stylesheets and fonts
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    # Audio and video, including streaming segments
+    "*.mp4", "*.webm", "*.m4s", "*.m3u8", "*.mp3", "*.ogg", "*.wav",
+]
+# Analytics, tag managers and ad networks, blocked by hostname (including subdomains)
+TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "googlesyndication.com", "connect.facebook.net", "hotjar.com",
+    "segment.io", "cdn.segment.com", "mixpanel.com", "clarity.ms",
+)
+
+# Links to downloadable files/areas, matched against the URL path in a single scan
+DOWNLOAD_RE = re.compile(
+    r'\.(pdf|zip|rar|tar|gz|7z|exe|msi|dmg|pkg|deb|rpm|docx?|xlsx?|pptx?|mp3|mp4|avi|mov|jpe?g|png|gif)$'
+    r'|/(downloads?|archives?|attachments?|files?|documents?)(/|$)',
+    re.IGNORECASE
+)
+
+
+def blocked_url_patterns(domain: str) -> List[str]:
+    """
+    Builds the Network.setBlockedURLs patterns for a crawl of the given domain.
+
+    Tracker patterns are anchored to the host, so a tracker's name in a path or query
+    string does not block the request. Trackers on the crawled site's own domain are left
+    out, since the patterns also apply to the pages being crawled.
+
+    Args:
+        domain (str): The crawl's domain, without "www.".
+
+    Returns:
+        List[str]: URL patterns to block in the browser.
+    """
+    patterns = list(BLOCKED_URL_PATTERNS)
+    for host in TRACKER_HOSTS:
+        if domain == host or domain.endswith("." + host) or host.endswith("." + domain):
+            continue
+        patterns += [f"*://{host}/*", f"*://*.{host}/*"]
+    return patterns
+
+
+def is_html_content_type(content_type: str) -> bool:
+    """
+    Checks whether a Content-Type header names an HTML document.
+
+    Args:
+        content_type (str): Content-Type header value, possibly with parameters such as the charset.
+
+    Returns:
+        bool: True if the response holds HTML.
+    """
+    return content_type.split(';', 1)[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+def is_boilerplate(tag) -> bool:
+    """
+    Checks whether a tag is page chrome (scripts, navigation, ads) rather than content.
+
+    Args:
+        tag: BeautifulSoup tag.
+
+    Returns:
+        bool: True if the tag should be removed before text extraction.
+    """
+    if tag.name in UNWANTED_TAGS:
+        return True
+    classes = tag.get('class') or []
+    if UNWANTED_CLASSES.intersection(classes):
+        return True
+    return tag.name in ('aside', 'div') and 'ad' in classes
+
+
+def parse_html(html_content: str) -> Tuple[str, str, List[str]]:
+    """
+    Parses HTML once and extracts the title, the cleaned body text and the raw link targets.
+
+    Uses lxml directly and removes all boilerplate with one XPath sweep; falls back to
+    BeautifulSoup if lxml cannot parse the document. Kept at module level so it can run
+    in a worker process.
+
+    Args:
+        html_content (str): Raw HTML content.
+
+    Returns:
+        Tuple[str, str, List[str]]: Page title, cleaned text content and the href of every anchor.
+    """
+    # Hand the parser a decoded str so it never falls back to encoding detection
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode('utf-8', errors='replace')
+    try:
+        root = lxml.html.document_fromstring(html_content)
+    except (etree.ParserError, ValueError):
+        return parse_html_with_soup(html_content)
+    title_element = root.find('.//title')
+    title = title_element.text_content().strip() if title_element is not None else ""
+    # Collect links before boilerplate removal, navigation menus hold most of them
+    hrefs = [href.strip() for href in root.xpath('//a/@href') if href.strip()]
+    base_href = root.xpath('string(//base[@href][1]/@href)').strip()
+    if base_href:
+        # Resolve against <base href> like the browser's a.href; extract_links joins the rest with the page URL
+        hrefs = [urljoin(base_href, href) for href in hrefs]
+    body = root.find('body')
+    if body is None:
+        body = root
+    for unwanted in BOILERPLATE_XPATH(body):
+        unwanted.drop_tree()  # Keeps the element's tail text, which belongs to its parent
+    text = ' '.join(' '.join(body.itertext()).split())
+    return title, text, hrefs
+
+
+def parse_html_with_soup(html_content: str) -> Tuple[str, str, List[str]]:
+    """
+    BeautifulSoup variant of parse_html, used for documents lxml rejects.
+
+    Args:
+        html_content (str): Decoded HTML content.
+
+    Returns:
+        Tuple[str, str, List[str]]: Page title, cleaned text content and the href of every anchor.
+    """
+    soup = BeautifulSoup(html_content, 'lxml')
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    # Collect links before boilerplate removal, navigation menus hold most of them
+    hrefs = [a['href'].strip() for a in soup.find_all('a', href=True) if a['href'].strip()]
+    base = soup.find('base', href=True)
+    if base and base['href'].strip():
+        hrefs = [urljoin(base['href'].strip(), href) for href in hrefs]
+    root = soup.body or soup
+    # Single traversal to drop all boilerplate subtrees
+    for unwanted in root.find_all(is_boilerplate):
+        unwanted.decompose()
+    # split() already drops leading/trailing whitespace, so get_text needn't strip each string
+    text = ' '.join(root.get_text(separator=' ').split())
+    return title, text, hrefs
+
+
+def new_parse_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Creates the process pool pages are parsed in.
+
+    The pool has PARSE_WORKERS processes, or DEFAULT_PARSE_WORKERS capped by the CPUs this
+    process may run on; os.cpu_count() reports the host's cores, not a container's limits.
+    Workers are started from a fork server rather than forked from the crawler, whose
+    aiohttp, aiofiles and Playwright threads could leave locks held in the children.
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: Pool to run parse_html in.
+    """
+    max_workers = os.environ.get("PARSE_WORKERS")
+    if max_workers:
+        max_workers = max(1, int(max_workers))
+    else:
+        available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        max_workers = min(DEFAULT_PARSE_WORKERS, available)
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("forkserver")
+    )
+
+
+def is_parse_pool_broken(pool: concurrent.futures.ProcessPoolExecutor) -> bool:
+    """
+    Checks whether a parser pool lost a process (e.g. OOM-killed) and refuses new work.
+
+    Args:
+        pool (ProcessPoolExecutor): Pool created by new_parse_pool().
+
+    Returns:
+        bool: True if the pool must be replaced.
+    """
+    try:
+        pool.submit(int)  # Rejected straight away by a broken pool
+    except BrokenProcessPool:
+        return True
+    return False
+
+
+@functools.lru_cache(maxsize=100_000)
+def split_link(link: str) -> Tuple[str, str, str]:
+    """
+    Splits a link into its lowercased host, its path and its canonical form.
+
+    Cached because the same navigation links show up on nearly every page of a site.
+
+    Args:
+        link (str): The link to split.
+
+    Returns:
+        Tuple[str, str, str]: Lowercased netloc (empty for relative links), path, and
+        scheme://netloc/path with the query, fragment and trailing slash removed.
+    """
+    parsed = urlparse(link)
+    netloc = parsed.netloc.lower()
+    return netloc, parsed.path, f"{parsed.scheme.lower()}://{netloc}{parsed.path}".rstrip('/')
+
+
+@functools.lru_cache(maxsize=100_000)
+def canonicalize(url: str) -> str:
+    """
+    Builds the key used to decide whether two URLs point at the same page.
+
+    The scheme, a leading "www.", a default port, the query, the fragment and a
+    trailing slash are all ignored, so http/https and www/bare variants of a page
+    are only fetched once.
+
+    Args:
+        url (str): Absolute URL.
+
+    Returns:
+        str: Lowercased host followed by the path.
+    """
+    parsed = urlparse(url)
+    return canonical_netloc(parsed.scheme, parsed.netloc) + parsed.path.rstrip('/')
+
+
+def canonical_netloc(scheme: str, netloc: str) -> str:
+    """
+    Reduces a URL's host to the form canonicalize() compares.
+
+    Args:
+        scheme (str): URL scheme, used to recognise its default port.
+        netloc (str): Host with an optional port.
+
+    Returns:
+        str: Lowercased host without a leading "www." or a default port.
+    """
+    scheme = scheme.lower()
+    netloc = netloc.lower()
+    host, _, port = netloc.rpartition(':')
+    if (scheme, port) in (('http', '80'), ('https', '443')):
+        netloc = host
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    return netloc
+
+
+@functools.lru_cache(maxsize=100_000)
+def canonical_host(url: str) -> str:
+    """
+    Returns the site a URL belongs to, so www and bare hosts share politeness limits.
+
+    Args:
+        url (str): Absolute URL.
+
+    Returns:
+        str: Lowercased host without a leading "www." or a default port.
+    """
+    parsed = urlparse(url)
+    return canonical_netloc(parsed.scheme, parsed.netloc)
+
+
 class GPTCrawlerCore:
-    def __init__(self, start_url: str, max_pages: int = 100, concurrency: int = 5, job_id: str = "", redis_conn: Redis = None):
+    def __init__(self, start_url: str, max_pages: int = 100, concurrency: int = 5, job_id: str = "", redis_conn: Redis = None, context_rotation_pages: int = 50, browser=None, output_file: str = None, min_delay: float = 0.0, parse_pool: concurrent.futures.ProcessPoolExecutor = None):
         """
         Initializes the crawler with the given parameters.
 
@@ -21,25 +340,56 @@ class GPTCrawlerCore:
             max_pages (int, optional): Maximum number of pages to crawl. Defaults to 100.
             concurrency (int, optional): Number of concurrent crawling tasks. Defaults to 5.
             job_id (str, optional): Unique identifier for the crawl job. Defaults to "".
-            redis_conn (Redis, optional): Redis connection object. Defaults to None.
+            redis_conn (Redis, optional): Asyncio Redis connection object. Defaults to None.
+            context_rotation_pages (int, optional): Pages crawled before the browser context is recycled. Defaults to 50.
+            browser (optional): Already running Playwright browser to crawl with; it is left open. Defaults to None.
+            output_file (str, optional): JSON file results are streamed to while crawling; without one they are kept in `results`. Defaults to None.
+            min_delay (float, optional): Minimum seconds between two fetches from the same host. Defaults to 0.0.
+            parse_pool (ProcessPoolExecutor, optional): Shared pool to parse HTML in, see new_parse_pool(); it is left running. Defaults to None.
         """
-        self.start_url = start_url.rstrip('/')  # Ensure no trailing slash
+        self.start_url = self.normalize_url(start_url).rstrip('/')  # Canonical form, no fragment or trailing slash
         parsed_start = urlparse(start_url)
-        print(max_pages, "max_pages")
         self.domain = parsed_start.netloc.lower()
-        self.allowed_domains = {self.domain, "www." + self.domain}
+        if self.domain.startswith("www."):
+            self.domain = self.domain[4:]
+        self.allowed_domains = frozenset({self.domain, "www." + self.domain})
+        self.blocked_url_patterns = blocked_url_patterns(self.domain)
         self.max_pages = max_pages
         self.concurrency = concurrency  # Number of concurrent tasks
-        self.visited: Set[str] = set()
-        self.to_visit: List[str] = [self.start_url]
-        self.results: List[dict] = []
+        self.visited: Set[str] = set()  # canonicalize() keys of crawled pages
+        self.to_visit: Dict[str, Deque[str]] = {}  # Frontier, one FIFO per canonical_host()
+        self.host_order: Deque[str] = deque()  # Hosts with queued URLs, in round-robin order
+        self.last_fetch_time: Dict[str, float] = {}  # time.monotonic() of the latest fetch per canonical_host()
+        self.min_delay = min_delay
+        self.enqueue(self.start_url)
+        self.queued: Set[str] = {canonicalize(self.start_url)}  # Keys of every URL ever enqueued, for O(1) dedupe
+        self.seen_hashes: Dict[bytes, str] = {}  # Digest of each page text written -> its URL, to skip duplicate pages
+        self.results: List[dict] = []  # Only used when there is no output file
+        self.output_file = output_file
+        self.output_handle = None
+        self.output_lock = asyncio.Lock()
+        self.results_written = 0
         self.retry_limit = 3  # Number of retries for failed pages
         self.retry_count = {}  # Track retries per URL
-        self.sem = asyncio.Semaphore(self.concurrency)  # Semaphore for concurrency control
         self.page_pool = []
         self.page_queue = asyncio.Queue()
         self.job_id = job_id
         self.redis_conn = redis_conn
+        # Job progress waiting for the next Redis pipeline
+        self.pending_errors: List[bytes] = []  # Serialized error entries
+        self.pending_crawling: List[str] = []  # URLs to add to crawling_urls
+        self.pending_uncrawling: List[str] = []  # URLs to remove from crawling_urls
+        self.pending_crawled: List[str] = []  # URLs to append to crawled_urls
+        self.pending_links_found = 0
+        self.pending_current_url: Optional[str] = None  # None means unchanged
+        self.progress_lock = asyncio.Lock()  # Pipelines must land in order, or an LREM can overtake its LPUSH
+        self.progress_stop = asyncio.Event()  # Ends flush_progress_periodically after one last flush
+        self.context_rotation_pages = context_rotation_pages  # Recycle the context to cap Playwright memory
+        self.pages_since_rotation = 0
+        self.browser = browser  # Shared browser, owned by the caller
+        self.http_session: Optional[aiohttp.ClientSession] = None  # Plain HTTP fetches, tried before Playwright
+        self.parse_pool: Optional[concurrent.futures.ProcessPoolExecutor] = parse_pool  # HTML parsing off the event loop
+        self.owns_parse_pool = False  # Whether this crawl created parse_pool and must shut it down
 
     async def init_page_pool(self, context):
         """
@@ -48,114 +398,239 @@ class GPTCrawlerCore:
         Args:
             context: Playwright browser context.
         """
-        print(self.concurrency)
         for _ in range(self.concurrency):
             page = await context.new_page()
+            await self.block_resources(context, page)
             await self.page_queue.put(page)
             self.page_pool.append(page)
-            print(self.page_pool)
 
-    async def get_page_html(self, page: Page, selector: str = "body") -> str:
+    async def new_context(self, browser, storage_state: dict = None):
+        """
+        Creates a browser context configured for crawling.
+
+        Args:
+            browser: Playwright browser instance.
+            storage_state (dict, optional): Cookies/local storage carried over from a previous context. Defaults to None.
+
+        Returns:
+            Playwright browser context.
+        """
+        return await browser.new_context(user_agent=USER_AGENT, storage_state=storage_state)
+
+    async def close_page_pool(self):
+        """
+        Closes every page in the pool and empties the page queue.
+        """
+        while not self.page_queue.empty():
+            self.page_queue.get_nowait()
+        for page in self.page_pool:
+            await page.close()
+        self.page_pool = []
+
+    async def rotate_context(self, browser, context):
+        """
+        Replaces the browser context with a fresh one, keeping its storage state.
+
+        Playwright keeps request/response objects alive until their context is
+        closed, so long crawls recycle the context to release that memory.
+
+        Args:
+            browser: Playwright browser instance.
+            context: The browser context to retire.
+
+        Returns:
+            The new Playwright browser context.
+        """
+        logger.info("Recycling browser context after %d pages", self.pages_since_rotation)
+        storage_state = await context.storage_state()
+        await self.close_page_pool()
+        await context.close()
+        context = await self.new_context(browser, storage_state)
+        await self.init_page_pool(context)
+        self.pages_since_rotation = 0
+        return context
+
+    async def block_resources(self, context, page: Page):
+        """
+        Blocks static resources for a page at the CDP network layer.
+
+        Args:
+            context: Playwright browser context.
+            page (Page): Playwright page object.
         """
-        Retrieves the HTML content of the specified selector from the page.
+        cdp = await context.new_cdp_session(page)
+        await cdp.send("Network.enable")
+        await cdp.send("Network.setBlockedURLs", {"urls": self.blocked_url_patterns})
+
+    async def get_page_html(self, page: Page) -> str:
+        """
+        Retrieves the full HTML document of the page in a single round-trip.
 
         Args:
             page (Page): Playwright page object.
-            selector (str, optional): CSS selector to target. Defaults to "body".
 
         Returns:
-            str: Extracted HTML content.
+            str: Page HTML content.
         """
         try:
-            element = await page.query_selector(selector)
-            if element:
-                html = await element.inner_html()
-                return html.strip() if html else ""
-            return ""
+            return await page.content()
         except Exception as e:
-            self.record_error(self.current_url, f"Failed to get HTML content with selector '{selector}': {e}")
+            self.record_error(page.url, f"Failed to get HTML content: {e}")
             return ""
 
-    def extract_text_from_html(self, html_content: str) -> str:
+    async def fetch_static(self, url: str) -> Optional[Tuple[Optional[str], str]]:
         """
-        Extracts and cleans text from HTML content.
+        Fetches a page over plain HTTP, without rendering it in the browser.
 
         Args:
-            html_content (str): Raw HTML content.
+            url (str): The URL to fetch.
 
         Returns:
-            str: Cleaned text content.
+            Optional[Tuple[Optional[str], str]]: The HTML (None if the response is an HTTP error or
+            not an HTML document, so there is nothing to extract) and final URL after redirects,
+            or None if the request failed and the page should be rendered instead.
         """
+        if not self.http_session:
+            return None
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            for script_or_style in soup(['script', 'style', 'noscript']):
-                script_or_style.decompose()
-            for tag in ['navbar', 'footer', 'header', 'ads', 'nav']:
-                for unwanted in soup.find_all(tag):
-                    unwanted.decompose()
-            for unwanted in soup.find_all(class_=['navbar', 'footer', 'header', 'ads', 'nav']):
-                unwanted.decompose()
-            for unwanted in soup.find_all(['aside', 'div'], {'class': 'ad'}):
-                unwanted.decompose()
-            text = soup.get_text(separator=' ', strip=True)
-            return ' '.join(text.split())
-        except Exception as e:
-            self.record_error(self.current_url, f"Failed to extract text from HTML: {e}")
-            return ""
+            async with self.http_session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                if response.status >= 400:
+                    # An error page is not gated on JavaScript, rendering it would not help
+                    self.record_error(url, f"HTTP {response.status} for {url}")
+                    return None, str(response.url)
+                content_type = response.headers.get('Content-Type', '')
+                if not content_type:
+                    return None  # Let the browser sniff it
+                if not is_html_content_type(content_type):
+                    logger.info("Skipping non-HTML document (%s): %s", content_type, url)
+                    return None, str(response.url)
+                return await response.text(errors='replace'), str(response.url)
+        except Exception:
+            # Any HTTP-level failure is retried through Playwright
+            return None
 
-    async def extract_links(self, page: Page) -> List[str]:
+    async def render_page(self, url: str) -> Optional[Tuple[Tuple[str, str, List[str]], str]]:
         """
-        Extracts and normalizes links from the current page, excluding unwanted links.
+        Loads a page in a pooled Playwright page and extracts its rendered content.
+
+        Args:
+            url (str): The URL to render.
+
+        Returns:
+            Optional[Tuple[Tuple[str, str, List[str]], str]]: The extracted title, text and links
+            together with the final URL, or None if navigation failed or the document is not HTML.
+        """
+        page = await self.page_queue.get()
+        try:
+            content_type = await self.navigate_with_retry(page, url)
+            if content_type is None:
+                return None
+            self.pages_since_rotation += 1
+            if content_type and not is_html_content_type(content_type):
+                logger.info("Skipping non-HTML document (%s): %s", content_type, url)
+                return None
+            return await self.extract_rendered_content(page, url), page.url
+        finally:
+            await self.page_queue.put(page)  # Return the page to the pool
+
+    async def extract_rendered_content(self, page: Page, url: str) -> Tuple[str, str, List[str]]:
+        """
+        Extracts the title, cleaned body text and links from a rendered page inside the browser.
+
+        Scrubbing the DOM in place avoids shipping the HTML over CDP and parsing it again
+        in Python. The HTML is only fetched and parsed with bs4 if the script fails.
 
         Args:
             page (Page): Playwright page object.
+            url (str): The URL of the page, used when reporting errors.
+
+        Returns:
+            Tuple[str, str, List[str]]: Page title, cleaned text content and the href of every anchor.
+        """
+        try:
+            content = await page.evaluate(EXTRACT_CONTENT_JS, BOILERPLATE_SELECTOR)
+            return content["title"], content["text"], content["links"]
+        except Exception as e:
+            logger.debug("In-page extraction failed for %s, parsing HTML instead: %s", url, e)
+            return await self.extract_content(await self.get_page_html(page), url)
+
+    async def extract_content(self, html_content: str, url: str) -> Tuple[str, str, List[str]]:
+        """
+        Parses HTML in the parser process pool, keeping the event loop free for navigation.
+
+        Args:
+            html_content (str): Raw HTML content.
+            url (str): URL the HTML was loaded from, used when reporting errors.
+
+        Returns:
+            Tuple[str, str, List[str]]: Page title, cleaned text content and the href of every anchor.
+        """
+        if not html_content or len(html_content) < MIN_HTML_LENGTH:
+            return "", "", []  # Nothing to parse, skip the round trip to the pool
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = self.parse_pool
+            try:
+                return await loop.run_in_executor(pool, parse_html, html_content)
+            except BrokenProcessPool as e:
+                if attempt:
+                    self.record_error(url, f"Failed to extract content from HTML: {e}")
+                    return "", "", []
+                self.replace_parse_pool(pool)  # Then retry this page once in the new pool
+            except Exception as e:
+                self.record_error(url, f"Failed to extract content from HTML: {e}")
+                return "", "", []
+
+    def replace_parse_pool(self, broken_pool: concurrent.futures.ProcessPoolExecutor):
+        """
+        Swaps a broken parser pool for a new one that this crawl shuts down when it ends.
+
+        Args:
+            broken_pool (ProcessPoolExecutor): The pool that raised BrokenProcessPool.
+        """
+        if self.parse_pool is not broken_pool:
+            return  # Another page already replaced it
+        logger.warning("Parser pool is broken, starting a new one")
+        if self.owns_parse_pool:
+            broken_pool.shutdown(wait=False)
+        self.parse_pool = new_parse_pool()
+        self.owns_parse_pool = True
+
+    def extract_links(self, links: List[str], base_url: str) -> List[str]:
+        """
+        Normalizes links found on a page, excluding unwanted links.
+
+        Args:
+            links (List[str]): Raw href values from the page.
+            base_url (str): URL of the page, used to resolve relative links.
 
         Returns:
-            List[str]: List of normalized and filtered URLs.
+            List[str]: List of canonical (no query, fragment or trailing slash) and filtered URLs.
         """
         try:
-            links = await page.evaluate(
-                """() => Array.from(document.querySelectorAll('a[href]'))
-                           .map(a => a.href)
-                           .filter(href => href)"""
-            )
-            print(f"[DEBUG] Extracted links: {links}")
-            download_extensions = {
-                '.pdf', '.zip', '.rar', '.tar', '.gz', '.7z',
-                '.exe', '.msi', '.dmg', '.pkg', '.deb', '.rpm',
-                '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
-                '.mp3', '.mp4', '.avi', '.mov', '.jpg', '.jpeg', '.png', '.gif'
-            }
-            download_patterns = re.compile(r'(download|archive|attachment|file|document)s?', re.IGNORECASE)
-            normalized_links = []
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Extracted links: %s", links)
+            normalized_links: Set[str] = set()
             for link in links:
-                parsed = urlparse(link)
-                # Handle relative URLs by joining with the start URL
-                if not parsed.netloc:
-                    link = urljoin(self.start_url, link)
-                parsed = urlparse(link)  # Re-parse to get the absolute URL
-                link_domain = parsed.netloc.lower()
-                if any(parsed.path.lower().endswith(ext) for ext in download_extensions):
-                    print(f"[DEBUG] Skipping download link: {link}")
-                    continue
-                if download_patterns.search(parsed.path):
-                    print(f"[DEBUG] Skipping download pattern link: {link}")
-                    continue
-                if link_domain not in self.allowed_domains:
+                netloc, path, clean_link = split_link(link)
+                # Handle relative and scheme-relative ("//host/path") URLs by joining with the page URL
+                if not netloc or link.startswith('//'):
+                    link = urljoin(base_url, link)
+                    netloc, path, clean_link = split_link(link)
+                # Cheap set lookup first, most links on a page point elsewhere
+                if netloc not in self.allowed_domains:
                     continue  # Skip external links and undesired subdomains
-                clean_link = f"{parsed.scheme}://{parsed.netloc}{parsed.path}".rstrip('/')
-                if clean_link and clean_link not in normalized_links:
-                    normalized_links.append(clean_link)
-            new_links = list(set(normalized_links))
-            # Update links_found in Redis
-            if self.redis_conn and self.job_id:
-                self.redis_conn.hincrby(f"job:{self.job_id}", "links_found", len(new_links))
-            return new_links
+                if DOWNLOAD_RE.search(path):
+                    logger.debug("Skipping download link: %s", link)
+                    continue
+                if clean_link:
+                    normalized_links.add(clean_link)
+            return list(normalized_links)
         except Exception as e:
-            self.record_error(self.current_url, f"Failed to extract links: {e}")
+            self.record_error(base_url, f"Failed to extract links: {e}")
             return []
 
-    async def navigate_with_retry(self, page: Page, url: str) -> bool:
+    async def navigate_with_retry(self, page: Page, url: str) -> Optional[str]:
         """
         Attempts to navigate to a URL with retries in case of failures.
 
@@ -164,15 +639,14 @@ class GPTCrawlerCore:
             url (str): The URL to navigate to.
 
         Returns:
-            bool: True if navigation was successful, False otherwise.
+            Optional[str]: The Content-Type of the loaded document (empty if unknown), or None if
+            navigation failed.
         """
         retries = self.retry_count.get(url, 0)
         while retries < self.retry_limit:
             try:
-                await page.goto(url, timeout=30000, wait_until="domcontentloaded")  # Use 'domcontentloaded' to avoid waiting for all resources
-                await page.wait_for_load_state('domcontentloaded')
-                await asyncio.sleep(1)
-                return True
+                response = await page.goto(url, timeout=30000, wait_until="domcontentloaded")  # Use 'domcontentloaded' to avoid waiting for all resources
+                return response.headers.get("content-type", "") if response else ""
             except PlaywrightTimeoutError:
                 retries += 1
                 self.retry_count[url] = retries
@@ -183,12 +657,14 @@ class GPTCrawlerCore:
                 self.record_error(url, f"Failed to navigate to {url}: {e} (Attempt {retries}/{self.retry_limit})")
             # Adding a delay between retries to avoid hammering the server
             await asyncio.sleep(2)
-        return False
+        return None
 
     def normalize_url(self, url):
         """
         Normalizes a URL by removing its fragment.
 
+        Only used for the start URL; extract_links already yields canonical links.
+
         Args:
             url (str): The URL to normalize.
 
@@ -200,7 +676,11 @@ class GPTCrawlerCore:
 
     def record_error(self, url: str, message: str):
         """
-        Records an error message associated with a specific URL in Redis.
+        Records an error message associated with a specific URL.
+
+        The entry is buffered and pushed to the job's errors list in Redis by
+        the next flush_progress, so recording an error never blocks on Redis
+        and can be done from synchronous code.
 
         Args:
             url (str): The URL where the error occurred.
@@ -208,124 +688,337 @@ class GPTCrawlerCore:
         """
         if self.redis_conn and self.job_id:
             error_entry = {"url": url, "message": message, "timestamp": int(time.time())}
-            # Fetch existing errors
-            errors = self.redis_conn.hget(f"job:{self.job_id}", "errors")
-            if errors:
-                errors_list = json.loads(errors)
-            else:
-                errors_list = []
-            errors_list.append(error_entry)
-            self.redis_conn.hset(f"job:{self.job_id}", "errors", json.dumps(errors_list))
+            self.pending_errors.append(orjson.dumps(error_entry))
 
-    async def crawl_page(self, context, url: str):
+    def mark_crawling(self, url: str):
         """
-        Crawls a single page and extracts relevant information.
+        Buffers the progress update for a page that started crawling.
 
         Args:
-            context: Playwright browser context.
-            url (str): The URL of the page to crawl.
+            url (str): The URL being crawled.
         """
-        async with self.sem:
-            page = await self.page_queue.get()
-            url = self.normalize_url(url)
-            if url in self.visited:
-                await self.page_queue.put(page)  # Return the page to the pool
-                return
-            # Add to crawling_urls list
-            if self.redis_conn and self.job_id:
-                self.redis_conn.lpush(f"job:{self.job_id}:crawling_urls", url)
-            # Update current_url in Redis
-            if self.redis_conn and self.job_id:
-                self.redis_conn.hset(f"job:{self.job_id}", "current_url", url)
-            print(f"[INFO] Crawling ({len(self.visited)}/{self.max_pages}) - {url}")
-            success = await self.navigate_with_retry(page, url)
-            if not success:
-                await self.page_queue.put(page)
-                # Remove from crawling_urls since it failed
-                if self.redis_conn and self.job_id:
-                    self.redis_conn.lrem(f"job:{self.job_id}:crawling_urls", 0, url)
-                    self.redis_conn.hset(f"job:{self.job_id}", "current_url", "")
+        if self.redis_conn and self.job_id:
+            self.pending_crawling.append(url)
+            self.pending_current_url = url
+
+    def mark_finished(self, url: str, crawled: bool, links_found: int = 0):
+        """
+        Buffers the progress update for a page that finished, successfully or not.
+
+        Args:
+            url (str): The URL that was crawled.
+            crawled (bool): Whether the page was crawled successfully and written to the output.
+            links_found (int, optional): Number of links found on the page. Defaults to 0.
+        """
+        if not (self.redis_conn and self.job_id):
+            return
+        # A page that starts and finishes between two flushes never touches crawling_urls
+        if url in self.pending_crawling:
+            self.pending_crawling.remove(url)
+        else:
+            self.pending_uncrawling.append(url)
+        self.pending_current_url = ""
+        if crawled:
+            self.pending_crawled.append(url)
+        self.pending_links_found += links_found
+
+    async def flush_progress(self):
+        """
+        Pushes all buffered job progress and errors to Redis in a single pipeline.
+
+        Flushes run one at a time, in order. Redis failures are logged rather than raised,
+        losing that batch of progress but never the crawl.
+        """
+        if not (self.redis_conn and self.job_id):
+            return
+        async with self.progress_lock:
+            crawling, self.pending_crawling = self.pending_crawling, []
+            uncrawling, self.pending_uncrawling = self.pending_uncrawling, []
+            crawled, self.pending_crawled = self.pending_crawled, []
+            errors, self.pending_errors = self.pending_errors, []
+            links_found, self.pending_links_found = self.pending_links_found, 0
+            current_url, self.pending_current_url = self.pending_current_url, None
+            if not (crawling or uncrawling or crawled or errors or current_url is not None):
                 return
-            self.visited.add(url)
-            # Increment pages_crawled in Redis
-            if self.redis_conn and self.job_id:
-                self.redis_conn.hincrby(f"job:{self.job_id}", "pages_crawled", 1)
-                # Add to crawled_urls list
-                self.redis_conn.rpush(f"job:{self.job_id}:crawled_urls", url)
-                # Remove from crawling_urls list
-                self.redis_conn.lrem(f"job:{self.job_id}:crawling_urls", 0, url)
-                self.redis_conn.hset(f"job:{self.job_id}", "current_url", "")
+            job_key = f"job:{self.job_id}"
             try:
-                title = await page.title()
-                html_content = await self.get_page_html(page, "body")
-                text_content = self.extract_text_from_html(html_content)
-                self.results.append({
+                async with self.redis_conn.pipeline(transaction=False) as pipe:
+                    if crawling:
+                        pipe.lpush(f"{job_key}:crawling_urls", *crawling)
+                    for url in uncrawling:
+                        pipe.lrem(f"{job_key}:crawling_urls", 0, url)
+                    if crawled:
+                        pipe.hincrby(job_key, "pages_crawled", len(crawled))
+                        pipe.rpush(f"{job_key}:crawled_urls", *crawled)
+                    if links_found:
+                        pipe.hincrby(job_key, "links_found", links_found)
+                    if current_url is not None:
+                        pipe.hset(job_key, "current_url", current_url)
+                    if errors:
+                        pipe.rpush(f"{job_key}:errors", *errors)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning("Failed to publish job progress: %s", e)
+
+    async def flush_progress_periodically(self):
+        """
+        Flushes job progress every PROGRESS_FLUSH_INTERVAL seconds until `progress_stop` is set,
+        then flushes once more.
+
+        It is stopped through the event rather than cancelled, so a pipeline is never
+        interrupted after its batch was taken from the buffers.
+        """
+        while not self.progress_stop.is_set():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.progress_stop.wait(), PROGRESS_FLUSH_INTERVAL)
+            await self.flush_progress()
+
+    def enqueue(self, url: str):
+        """
+        Adds a URL to the frontier bucket of its host.
+
+        Args:
+            url (str): The URL to crawl later.
+        """
+        host = canonical_host(url)
+        bucket = self.to_visit.get(host)
+        if bucket is None:
+            bucket = self.to_visit[host] = deque()
+            self.host_order.append(host)
+        bucket.append(url)
+
+    def next_url(self) -> Optional[str]:
+        """
+        Takes the next URL from the frontier, cycling through hosts so one slow host
+        cannot occupy every concurrent page.
+
+        Returns:
+            Optional[str]: The URL to crawl, or None if every queued host was fetched
+            less than `min_delay` seconds ago.
+        """
+        now = time.monotonic()
+        for _ in range(len(self.host_order)):
+            host = self.host_order[0]
+            self.host_order.rotate(-1)
+            if now - self.last_fetch_time.get(host, float('-inf')) < self.min_delay:
+                continue
+            bucket = self.to_visit[host]
+            url = bucket.popleft()
+            if not bucket:
+                del self.to_visit[host]
+                self.host_order.remove(host)
+            self.last_fetch_time[host] = now
+            return url
+        return None
+
+    async def crawl_page(self, url: str):
+        """
+        Crawls a single page and extracts relevant information.
+
+        The page is first fetched over plain HTTP; Playwright is only used when that
+        fails or the static HTML carries too little text to be the rendered page.
+
+        Args:
+            url (str): The canonical URL of the page to crawl.
+        """
+        if canonicalize(url) in self.visited:
+            return
+        # Add to crawling_urls list and update current_url
+        self.mark_crawling(url)
+        logger.info("Crawling (%d/%d) - %s", len(self.visited), self.max_pages, url)
+        content = None
+        fetched = await self.fetch_static(url)
+        if fetched:
+            html_content, page_url = fetched
+            if html_content is None:
+                # HTTP error or not an HTML document (PDF, JSON, image...), there is no text to extract
+                self.mark_finished(url, crawled=False)
+                return
+            content = await self.extract_content(html_content, url), page_url
+        if not content or len(content[0][1]) < MIN_STATIC_TEXT_LENGTH:
+            # Missing or near-empty static HTML, likely a page rendered by JavaScript
+            content = await self.render_page(url) or content
+        if not content:
+            # Remove from crawling_urls since it failed
+            self.mark_finished(url, crawled=False)
+            return
+        self.visited.add(canonicalize(url))
+        links = []
+        duplicate = False
+        try:
+            (title, text_content, hrefs), page_url = content
+            digest = hashlib.blake2b(text_content.encode(), digest_size=16).digest()
+            original_url = self.seen_hashes.get(digest)
+            if original_url is not None:
+                # Same text as a page already written (printer view, pagination alias...), only follow its links
+                duplicate = True
+                logger.info("Skipping duplicate content: %s (same as %s)", url, original_url)
+            else:
+                self.seen_hashes[digest] = url
+                await self.write_result({
                     "title": title,
                     "url": url,
                     "text": text_content
                 })
-                print(f"[INFO] Successfully crawled: {url}")
-                links = await self.extract_links(page)
-                for link in links:
-                    normalized_link = self.normalize_url(link)
-                    if (normalized_link not in self.visited and 
-                        normalized_link not in self.to_visit and 
-                        len(self.visited) < self.max_pages):
-                        self.to_visit.append(normalized_link)
-                        print(f"[INFO] Enqueued: {normalized_link}")
-            except Exception as e:
-                self.record_error(url, f"Error processing {url}: {e}")
-            finally:
-                await self.page_queue.put(page)
+                logger.info("Successfully crawled: %s", url)
+            links = self.extract_links(hrefs, page_url)
+            for link in links:
+                key = canonicalize(link)
+                if key not in self.queued and len(self.visited) < self.max_pages:
+                    self.enqueue(link)
+                    self.queued.add(key)
+                    logger.debug("Enqueued: %s", link)
+        except Exception as e:
+            self.record_error(url, f"Error processing {url}: {e}")
+        # Move to crawled_urls and count it; published with the next progress flush.
+        # Duplicates are left out, they are not in the output either
+        self.mark_finished(url, crawled=not duplicate, links_found=len(links))
+        if len(self.pending_crawled) >= PROGRESS_FLUSH_PAGES:
+            await self.flush_progress()
 
     async def crawl(self):
         """
-        Orchestrates the crawling process using Playwright.
+        Orchestrates the crawling process using aiohttp and Playwright.
+
+        Uses the shared browser passed to the constructor if there is one, otherwise
+        launches (and closes) a browser for this crawl only.
         """
+        if self.browser is not None:
+            await self.crawl_with_browser(self.browser)
+            return
         async with async_playwright() as p:
-            print("[INFO] Launching browser...")
+            logger.info("Launching browser...")
             browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                user_agent=(
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/115.0.0.0 Safari/537.36"
-                )
-            )
-            # Block unnecessary resources to speed up crawling
-            await context.route("**/*.{png,jpg,jpeg,gif,svg,css,font,woff,woff2}", lambda route, _: route.abort())
-            # Initialize the page pool
-            await self.init_page_pool(context)
-            while self.to_visit and len(self.visited) < self.max_pages:
-                tasks = []
-                print(f"[DEBUG] To visit queue length: {len(self.to_visit)}")
-                while self.to_visit and len(tasks) < self.concurrency:
-                    url = self.to_visit.pop(0)
-                    if url not in self.visited:
-                        tasks.append(self.crawl_page(context, url))
-                if tasks:
-                    await asyncio.gather(*tasks)
-                    tasks = []
-            # Close all pages
-            for page in self.page_pool:
-                await page.close()
-            await context.close()  # Close the context
+            await self.crawl_with_browser(browser)
             await browser.close()
-            print("[INFO] Browser closed.")
+            logger.info("Browser closed.")
 
-    def write_output(self, output_file: str):
+    async def crawl_with_browser(self, browser):
         """
-        Writes the crawl results to a JSON file.
+        Crawls in a fresh context of an already running browser, closing only that context.
 
         Args:
-            output_file (str): The path to the output JSON file.
+            browser: Playwright browser instance.
+        """
+        connector = aiohttp.TCPConnector(limit=self.concurrency * 4)
+        async with aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT}) as session:
+            self.http_session = session
+            # Parse pages on every core instead of serializing them behind the event loop
+            if self.parse_pool is None:
+                self.parse_pool = new_parse_pool()
+                self.owns_parse_pool = True
+            # Keep up to `concurrency` pages in flight, starting a new one as soon as any finishes
+            in_flight: Set[asyncio.Task] = set()
+            progress_flusher = None
+            context = None
+            try:
+                if self.output_file:
+                    await self.open_output()
+                progress_flusher = asyncio.create_task(self.flush_progress_periodically())
+                context = await self.new_context(browser)
+                # Initialize the page pool (each page blocks unnecessary resources)
+                await self.init_page_pool(context)
+                # Every fetch counts toward max_pages, duplicates included, so pages that
+                # repeat their text forever (soft 404s, endless pagination) cannot run away
+                while (self.to_visit or in_flight) and len(self.visited) < self.max_pages:
+                    if self.pages_since_rotation >= self.context_rotation_pages and self.to_visit:
+                        # Drain first so no crawl_page is using the old context
+                        if in_flight:
+                            await asyncio.gather(*in_flight)
+                            in_flight = set()
+                        context = await self.rotate_context(browser, context)
+                    logger.debug("Hosts with queued URLs: %d", len(self.to_visit))
+                    throttled = False
+                    # Never have more pages in flight than are left under max_pages
+                    while self.to_visit and len(in_flight) < min(self.concurrency, self.max_pages - len(self.visited)):
+                        url = self.next_url()
+                        if url is None:
+                            throttled = True  # Every queued host is waiting out min_delay
+                            break
+                        if canonicalize(url) not in self.visited:
+                            in_flight.add(asyncio.create_task(self.crawl_page(url)))
+                    if not in_flight:
+                        if throttled:
+                            await asyncio.sleep(self.min_delay)
+                        continue
+                    # Wake up when a throttled host may be fetched again, even if nothing finished
+                    done, in_flight = await asyncio.wait(
+                        in_flight, timeout=self.min_delay if throttled else None, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        task.result()  # Surface unexpected failures like gather() did
+                if in_flight:
+                    await asyncio.gather(*in_flight)
+            finally:
+                # Also runs when the crawl fails: the event loop and browser outlive this job,
+                # so nothing it started may be left behind
+                for task in in_flight:
+                    task.cancel()
+                await asyncio.gather(*in_flight, return_exceptions=True)
+                if progress_flusher:
+                    self.progress_stop.set()
+                    await progress_flusher  # Publishes whatever is still buffered
+                self.http_session = None
+                if self.owns_parse_pool:
+                    # Let the worker processes exit in the background instead of blocking the event loop
+                    self.parse_pool.shutdown(wait=False)
+                    self.parse_pool = None
+                    self.owns_parse_pool = False
+                await self.close_output()
+                try:
+                    # Close all pages and the context, the browser may be shared
+                    await self.close_page_pool()
+                    if context:
+                        await context.close()
+                except Exception as e:
+                    logger.warning("Failed to close browser context: %s", e)
+        await self.flush_progress()
+
+    async def open_output(self):
+        """
+        Starts the JSON array in a temporary file next to the output file.
+        """
+        try:
+            output_dir = os.path.dirname(self.output_file)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)  # Ensure the output directory exists
+            self.output_handle = await aiofiles.open(self.output_file + ".part", 'wb')
+            await self.output_handle.write(b"[")
+        except Exception as e:
+            self.record_error(self.start_url, f"Failed to open output file: {e}")
+            self.output_handle = None
+
+    async def write_result(self, entry: dict):
+        """
+        Appends one page's result to the output file as soon as it is crawled.
+
+        Results are only kept in memory when the crawler has no output file.
+
+        Args:
+            entry (dict): The page's title, URL and text.
+        """
+        if not self.output_file:
+            self.results.append(entry)
+            return
+        if not self.output_handle:
+            return
+        # Serialize writes so entries and their separators never interleave
+        async with self.output_lock:
+            separator = b",\n" if self.results_written else b"\n"
+            await self.output_handle.write(separator + orjson.dumps(entry, option=orjson.OPT_INDENT_2))
+            self.results_written += 1
+
+    async def close_output(self):
+        """
+        Terminates the JSON array and moves the finished file into place.
         """
+        if not self.output_handle:
+            return
         try:
-            # Get the absolute path to ensure the directory exists
-            output_dir = os.path.dirname(output_file)
-            os.makedirs(output_dir, exist_ok=True)  # Ensure the output directory exists
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(self.results, f, ensure_ascii=False, indent=2)
-            print(f"[INFO] Output written to {output_file}")
+            await self.output_handle.write(b"\n]\n")
+            await self.output_handle.close()
+            os.replace(self.output_file + ".part", self.output_file)
+            logger.info("Output written to %s", self.output_file)
         except Exception as e:
             self.record_error(self.start_url, f"Failed to write output file: {e}")
+        self.output_handle = None
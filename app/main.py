@@ -1,14 +1,15 @@
 # main.py
 
 from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware  # Import CORSMiddleware
 from redis import Redis
 from rq import Queue
 import os
 import time
+from functools import lru_cache
 from app.worker import run_crawler
-import json
+import orjson
 import uuid  # For generating unique job IDs
 from typing import List  # Import List for type hinting
 
@@ -27,6 +28,22 @@ app.add_middleware(
 redis_conn = Redis(host="redis", port=6379, decode_responses=True)
 queue = Queue(connection=redis_conn)
 
+@lru_cache(maxsize=8)
+def load_job_index(output_file: str, mtime_ns: int) -> dict:
+    """
+    Loads a crawl output file into a {url: item} lookup, cached per file version.
+
+    Args:
+        output_file (str): Path to the crawl output JSON file.
+        mtime_ns (int): Modification time of the file; part of the cache key so a rewritten file is reloaded.
+
+    Returns:
+        dict: Crawl results keyed by URL. Shared between requests, so callers must not modify it.
+    """
+    with open(output_file, 'rb') as f:
+        crawl_data = orjson.loads(f.read())
+    return {item['url']: item for item in crawl_data}
+
 @app.get("/")
 async def root():
     """
@@ -89,11 +106,11 @@ async def get_status(job_id: str):
     current_url = redis_conn.hget(job_key, "current_url")
     start_time = redis_conn.hget(job_key, "start_time")
     end_time = redis_conn.hget(job_key, "end_time")
-    errors = redis_conn.hget(job_key, "errors")
     
-    # Fetch crawled and crawling URLs
+    # Fetch crawled and crawling URLs and errors
     crawled_urls = redis_conn.lrange(f"{job_key}:crawled_urls", 0, -1)
     crawling_urls = redis_conn.lrange(f"{job_key}:crawling_urls", 0, -1)
+    errors = redis_conn.lrange(f"{job_key}:errors", 0, -1)
     
     return {
         "job_id": job_id,
@@ -105,7 +122,7 @@ async def get_status(job_id: str):
         "crawling_urls": crawling_urls,
         "start_time": int(start_time) if start_time else None,
         "end_time": int(end_time) if end_time else None,
-        "errors": json.loads(errors) if errors else []
+        "errors": [orjson.loads(error) for error in errors]
     }
 
 # POST endpoint to retrieve filtered JSON based on a list of URLs
@@ -122,7 +139,7 @@ async def get_filtered_output(job_id: str, payload: dict):
                         }
 
     Returns:
-        JSONResponse: Filtered JSON data containing only the specified URLs.
+        Response: Filtered JSON data containing only the specified URLs.
     """
     job_key = f"job:{job_id}"
     output_file = f"app/outputs/{job_id}.json"
@@ -135,12 +152,8 @@ async def get_filtered_output(job_id: str, payload: dict):
     if not isinstance(urls, list):
         raise HTTPException(status_code=400, detail="The 'urls' field must be a list of URLs.")
     
-    # Load the entire crawl result
-    with open(output_file, 'r', encoding='utf-8') as f:
-        crawl_data = json.load(f)
-    
-    # Create a dictionary for quick lookup
-    crawl_data_dict = {item['url']: item for item in crawl_data}
+    # Load the crawl result as a URL lookup, parsed once per version of the file
+    crawl_data_dict = load_job_index(output_file, os.stat(output_file).st_mtime_ns)
     
     # Prepare filtered data
     filtered_data = []
@@ -151,11 +164,12 @@ async def get_filtered_output(job_id: str, payload: dict):
         else:
             missing_urls.append(url)
     
-    return JSONResponse(content={
+    # Serialize with orjson directly, the filtered data can hold many full pages of text
+    return Response(content=orjson.dumps({
         "job_id": job_id,
         "filtered_data": filtered_data,
         "missing_urls": missing_urls
-    })
+    }), media_type="application/json")
 
 # GET endpoint to retrieve the output.json as a downloadable file
 @app.get("/get-output/{job_id}")
@@ -1,14 +1,93 @@
 # worker.py
 
 import asyncio
+import contextlib
+import logging
 from redis import Redis
+from redis.asyncio import ConnectionPool as AsyncConnectionPool, Redis as AsyncRedis
 import os
-from app.gptcrawlercore import GPTCrawlerCore
+from playwright.async_api import async_playwright
+from app.gptcrawlercore import GPTCrawlerCore, is_parse_pool_broken, new_parse_pool
 import time
 
+# Status lines at INFO; per-link crawler output is only emitted at DEBUG
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
 # Initialize Redis connection
 redis_conn = Redis(host="redis", port=6379, decode_responses=True)
 
+# Event loop, Chromium and the parser processes kept alive across jobs, so only the first
+# job pays their startup. This needs a non-forking worker: `rq worker --worker-class rq.SimpleWorker`.
+event_loop = None
+playwright = None
+browser = None
+parse_pool = None
+
+async def get_browser():
+    """
+    Returns the shared browser, launching it on first use or after it has crashed.
+
+    Returns:
+        Playwright browser instance.
+    """
+    global playwright, browser
+    if browser is None or not browser.is_connected():
+        if playwright is None:
+            playwright = await async_playwright().start()
+        logger.info("Launching browser...")
+        browser = await playwright.chromium.launch(headless=True)
+    return browser
+
+def get_parse_pool():
+    """
+    Returns the shared HTML parser pool, creating it on first use or after one of its
+    processes has died.
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: Pool the crawler parses pages in.
+    """
+    global parse_pool
+    if parse_pool is None or is_parse_pool_broken(parse_pool):
+        if parse_pool is not None:
+            logger.warning("Parser pool is broken, starting a new one...")
+            parse_pool.shutdown(wait=False)
+        parse_pool = new_parse_pool()
+    return parse_pool
+
+async def crawl_and_write(job_id: str, start_url: str, max_pages: int, concurrency: int, output_file: str):
+    """
+    Runs the crawl, streaming its output to disk, with an asyncio Redis client.
+
+    Args:
+        job_id (str): Unique identifier for the crawl job.
+        start_url (str): The URL to start crawling from.
+        max_pages (int): Maximum number of pages to crawl.
+        concurrency (int): Number of concurrent crawling tasks.
+        output_file (str): The path to the output JSON file.
+    """
+    # Pool sized to the crawl so concurrent pages never wait on a connection
+    async_redis_conn = AsyncRedis(connection_pool=AsyncConnectionPool(
+        host="redis", port=6379, decode_responses=True, max_connections=concurrency * 2
+    ))
+    try:
+        # Create the crawler with job_id and redis_conn
+        crawler = GPTCrawlerCore(
+            start_url=start_url,
+            max_pages=max_pages,
+            concurrency=concurrency,
+            job_id=job_id,
+            redis_conn=async_redis_conn,
+            browser=await get_browser(),
+            output_file=output_file,
+            parse_pool=get_parse_pool()
+        )
+
+        # Run the crawler, writing each page's result to output file as it is crawled
+        await crawler.crawl()
+    finally:
+        await async_redis_conn.aclose(close_connection_pool=True)  # The pool was passed in, aclose() alone leaves it open
+
 def run_crawler(job_id: str, start_url: str, max_pages: int = 10):
     """
     Runs the web crawler and updates the job status in Redis.
@@ -25,31 +104,31 @@ def run_crawler(job_id: str, start_url: str, max_pages: int = 10):
         "pages_crawled": 0,
         "current_url": "",
         "start_time": int(time.time()),
-        "end_time": "",
-        "errors": "[]"
+        "end_time": ""
     })
     
-    # Initialize lists for crawled and crawling URLs
+    # Initialize lists for crawled and crawling URLs and errors
     redis_conn.delete(f"job:{job_id}:crawled_urls")
     redis_conn.delete(f"job:{job_id}:crawling_urls")
+    redis_conn.delete(f"job:{job_id}:errors")
     
-    # Create the crawler with job_id and redis_conn
-    crawler = GPTCrawlerCore(
-        start_url=start_url,
-        max_pages=max_pages,
-        concurrency=5,
-        job_id=job_id,
-        redis_conn=redis_conn
-    )
-
-    # Run the crawler
-    asyncio.run(crawler.crawl())
-
     # Define output file path using unique job_id
     output_file = os.path.join("app", "outputs", f"{job_id}.json")
 
-    # Write the crawling results to output file
-    crawler.write_output(output_file=output_file)
+    global event_loop
+    if event_loop is None:
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+    crawl_task = event_loop.create_task(crawl_and_write(job_id, start_url, max_pages, 5, output_file))
+    try:
+        event_loop.run_until_complete(crawl_task)
+    finally:
+        if not crawl_task.done():
+            # Interrupted from outside the loop (e.g. RQ's job timeout): let the crawl clean up
+            # now rather than resuming inside the next job's run_until_complete
+            crawl_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                event_loop.run_until_complete(crawl_task)
 
     # Update job status to completed and set end_time
     redis_conn.hset(f"job:{job_id}", mapping={
@@ -58,4 +137,4 @@ def run_crawler(job_id: str, start_url: str, max_pages: int = 10):
         "current_url": ""
     })
 
-    print(f"[INFO] Job {job_id} completed")
+    logger.info("Job %s completed", job_id)